@@ -5,22 +5,22 @@ This script implements a Flask web server that listens for incoming TradingView
 requests on the `/tradingview` endpoint. When a webhook is received, the script:
 
   1. Logs and processes the raw webhook payload.
-  2. Executes the external `parse_alert.py` script to convert the alert text into JSON.
-  3. If the parsed alert contains the required keys (action, ticker, position), it executes
-     the external `order.py` script (located in the coinbase directory) to execute the order.
+  2. Calls `parse_alert` (imported from the coinbase directory) to convert the alert text
+     into structured data.
+  3. If the parsed alert contains the required keys (action, ticker, position), it places
+     the orders in-process with `place_order` from `order.py` (in the coinbase directory).
   4. Logs all steps of the process, including successes and errors.
 """
 
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import os
 import sys
-import subprocess
 from logging import Logger
 from flask import Flask, request, jsonify
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Tuple
 
 # -----------------------
 # Constants and Path Settings
@@ -28,15 +28,16 @@ from typing import Any, Dict, Optional
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 COINBASE_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", "coinbase"))
-PARSE_ALERT_SCRIPT_PATH = os.path.join(COINBASE_DIR, "parse_alert.py")
-ORDER_SCRIPT_PATH = os.path.join(COINBASE_DIR, "order.py")
-PYTHON_COMMAND = sys.executable  # Use the current Python interpreter
 FLASK_HOST = "0.0.0.0"
 FLASK_PORT = 5002
 
 # Add the coinbase directory to PYTHONPATH so we can import if needed.
 sys.path.insert(0, COINBASE_DIR)
 
+from parse_alert import parse_alert
+from order import place_order
+from order_request import OrderRequest
+
 # -----------------------
 # Logging Configuration
 # -----------------------
@@ -76,33 +77,60 @@ def parse_input_data(content_type: str, raw_data: str) -> Dict[str, Any]:
 
 def execute_parse_alert(alert_text: str) -> Dict[str, Any]:
     """
-    Execute the external parse_alert.py script with the given alert text.
+    Parse the alert text in-process with `parse_alert`.
     
     Returns:
         dict: The parsed alert as a dictionary.
     """
     try:
-        cmd = [PYTHON_COMMAND, PARSE_ALERT_SCRIPT_PATH, alert_text]
-        logger.info("Executing parse_alert command: %s", " ".join(cmd))
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        logger.info("parse_alert output: %s", result.stdout)
-        # Attempt to decode JSON output.
-        alert_data = json.loads(result.stdout.strip())
+        alert_data = parse_alert(alert_text)
+        if alert_data is None:
+            logger.error("parse_alert could not parse: %s", alert_text)
+            return {"error": "Failed to parse alert text"}
         return alert_data
-    except subprocess.CalledProcessError as e:
-        logger.error("parse_alert execution failed: %s", e)
-        return {"error": str(e)}
     except Exception as e:
         logger.error("Unexpected error in execute_parse_alert: %s", e)
         return {"error": str(e)}
 
 
+def submit_alert_order(label: str, req: OrderRequest) -> Dict[str, Any]:
+    """
+    Submit one order through order.place_order and log the result.
+    Raises RuntimeError if the order failed, so later orders are skipped.
+    """
+    result = place_order(req)
+    if result["exit_code"] != 0:
+        raise RuntimeError(f"{label} failed: {result['status']}")
+    logger.info("%s executed: %s", label, result)
+    return result
+
+
+async def submit_exit_orders(exit_orders: List[Tuple[str, str, OrderRequest]]) -> List[Any]:
+    """
+    Submit the stop-loss and take-profit orders concurrently.
+    Each entry of exit_orders is (result key, label, order request).
+    Returns one result dict, or the raised exception, per order.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *(
+            loop.run_in_executor(None, submit_alert_order, label, req)
+            for _, label, req in exit_orders
+        ),
+        return_exceptions=True,
+    )
+
+
 def execute_order(alert: Dict[str, Any]) -> Dict[str, Any]:
     """
     Execute orders as:
     - Main order: Market IOC
     - Stop-loss: Stop-limit GTC with trigger 0.5% away
     - Take-profit: Market IOC
+
+    All orders are placed in-process through one shared REST client. The stop-loss
+    and take-profit orders only depend on the main order, so they are sent together.
+    If either exit order fails, the result holds both outcomes plus an "error" entry.
     """
     try:
         action = alert["action"].upper()
@@ -112,53 +140,49 @@ def execute_order(alert: Dict[str, Any]) -> Dict[str, Any]:
 
         # 1. Main Market Order (IOC)
         logger.info("Executing main market order: %s %s %s", action, ticker, position)
-        cmd = [
-            PYTHON_COMMAND,
-            ORDER_SCRIPT_PATH,
-            f"{action} {ticker} {position}",
-            "--option", "market_ioc"
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=COINBASE_DIR)
-        results["main_order"] = {"stdout": result.stdout}
-        logger.info("Main order executed: %s", result.stdout)
+        results["main_order"] = submit_alert_order(
+            "Main order", OrderRequest(action, ticker, position, option="market_ioc")
+        )
+
+        exit_action = "SELL" if action == "BUY" else "BUY"
+        exit_orders = []
 
         # 2. Stop Loss Order (if provided)
         if "stop_loss" in alert:
-            sl_action = "SELL" if action == "BUY" else "BUY"
             sl_price = float(alert["stop_loss"])
             # Calculate trigger price 0.5% away
             sl_trigger = sl_price * (0.995 if action == "BUY" else 1.005)
-            
-            cmd = [
-                PYTHON_COMMAND,
-                ORDER_SCRIPT_PATH,
-                f"{sl_action} {ticker} {position}",
-                "--option", "stop_limit_gtc",
-                "--stop-price", f"{sl_trigger:.3f}",
-                "--limit-price", f"{sl_price:.3f}"
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=COINBASE_DIR)
-            results["stop_loss"] = {"stdout": result.stdout}
-            logger.info("Stop-loss order executed: %s", result.stdout)
+            exit_orders.append(("stop_loss", "Stop-loss order", OrderRequest(
+                exit_action, ticker, position,
+                option="stop_limit_gtc",
+                limit_price=f"{sl_price:.3f}",
+                stop_price=f"{sl_trigger:.3f}"
+            )))
 
         # 3. Take Profit Order (if provided)
         if "take_profit" in alert:
-            tp_action = "SELL" if action == "BUY" else "BUY"
-            tp_price = str(alert["take_profit"])
-            
-            cmd = [
-                PYTHON_COMMAND,
-                ORDER_SCRIPT_PATH,
-                f"{tp_action} {ticker} {position}",
-                "--option", "market_ioc"
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=COINBASE_DIR)
-            results["take_profit"] = {"stdout": result.stdout}
-            logger.info("Take-profit order executed: %s", result.stdout)
+            exit_orders.append(("take_profit", "Take-profit order", OrderRequest(
+                exit_action, ticker, position, option="market_ioc"
+            )))
+
+        if exit_orders:
+            # Record every exit order's outcome, so a failed stop-loss does not hide
+            # a take-profit that was placed (or vice versa).
+            exit_results = asyncio.run(submit_exit_orders(exit_orders))
+            errors = []
+            for (key, _, _), result in zip(exit_orders, exit_results):
+                if isinstance(result, Exception):
+                    results[key] = {"error": str(result)}
+                    errors.append(str(result))
+                else:
+                    results[key] = result
+            if errors:
+                logger.error("Order execution failed: %s; results: %s", "; ".join(errors), results)
+                results["error"] = f"Order execution failed: {'; '.join(errors)}"
 
         return results
 
-    except subprocess.CalledProcessError as e:
+    except RuntimeError as e:
         logger.error("Order execution failed: %s", e)
         return {"error": f"Order execution failed: {str(e)}"}
     except Exception as e:
@@ -171,7 +195,7 @@ def process_webhook() -> Dict[str, Any]:
     Process the incoming webhook:
       - Parse the input data.
       - If a 'text' field is found, execute parse_alert.py to convert it into structured data.
-      - If the parsed alert contains the required keys, execute order.py to place the order.
+      - If the parsed alert contains the required keys, place the orders via order.place_order.
     """
     content_type = request.content_type or "unknown"
     raw_data = request.data.decode("utf-8", errors="replace")
@@ -222,36 +246,6 @@ def parse_tradingview_format(raw_data: str) -> Dict[str, Any]:
         return {"error": "Invalid TradingView format"}
 
 
-def parse_tradingview_alert(alert_text: str) -> Optional[Dict[str, Any]]:
-    """Parse the alert text using the external parse_alert.py script."""
-    try:
-        # Use absolute path for both executable and script
-        cmd = [
-            PYTHON_COMMAND,
-            os.path.abspath(PARSE_ALERT_SCRIPT_PATH),  # Use absolute path
-            alert_text
-        ]
-        
-        logger.info(f"Executing parse command from {COINBASE_DIR}: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=COINBASE_DIR
-        )
-        
-        return json.loads(result.stdout)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Parse alert failed. Command: {' '.join(cmd)}")
-        logger.error(f"Working directory: {COINBASE_DIR}")
-        logger.error(f"STDERR: {e.stderr}")
-        return {"error": str(e)}
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON output: {e}")
-        return {"error": f"JSON parse error: {str(e)}"}
-
-
 # -----------------------
 # Flask Application Setup
 # -----------------------
@@ -0,0 +1,33 @@
+"""
+_log.py
+
+Console logging setup shared by order.py and trade.py.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+
+
+def init_logger(enabled: bool = True) -> None:
+    """
+    Initialize Python's built-in logging for console output, or disable it.
+    Records are handed to a QueueListener thread that writes them to stderr, so a
+    slow log consumer never blocks order placement. Queued records are flushed at exit.
+    """
+    if enabled:
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(
+            logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+        )
+        listener = logging.handlers.QueueListener(log_queue, console_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        root_logger = logging.getLogger()
+        root_logger.setLevel(logging.INFO)
+        root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logging.info("Logging is enabled.")
+    else:
+        logging.disable(logging.CRITICAL)
@@ -0,0 +1,63 @@
+"""
+_order_ids.py
+
+Local order IDs (sent to Coinbase as client_order_id) for order.py, trade.py and
+the webhook listener. Coinbase treats a reused client_order_id as a retry of the
+earlier order and places nothing new, so every process must reserve its IDs here.
+Both files live next to this script, whatever the caller's working directory.
+"""
+
+import fcntl
+import os
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# CSV order log; the first column of each line is the local order ID.
+ORDER_ID_FILE = os.path.join(SCRIPT_DIR, "order_id.txt")
+# Last reserved local ID, as an 8-byte big-endian integer.
+ORDER_ID_COUNTER_FILE = os.path.join(SCRIPT_DIR, "order_id.counter")
+ORDER_ID_TAIL_BYTES = 4096  # bytes read from the end of ORDER_ID_FILE to find the last ID
+
+
+def read_last_logged_order_id() -> int:
+    """
+    Read the last local order ID from the tail of ORDER_ID_FILE.
+    Only the last ORDER_ID_TAIL_BYTES are read, so the cost does not grow with
+    the order history. Returns 1000 if the file is missing or unreadable.
+    """
+    last_order_id = 1000
+    if os.path.exists(ORDER_ID_FILE):
+        with open(ORDER_ID_FILE, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - ORDER_ID_TAIL_BYTES))
+            lines = f.read().strip().splitlines()
+            if lines:
+                try:
+                    last_order_id = int(lines[-1].split(b",", 1)[0])
+                except ValueError:
+                    last_order_id = 1000
+    return last_order_id
+
+
+def reserve_order_ids(count: int = 1) -> int:
+    """
+    Atomically reserve a block of `count` local order IDs and return the first one.
+    ORDER_ID_COUNTER_FILE is read and updated under an exclusive flock on every call,
+    so concurrent processes and threads never receive the same ID, even while their
+    orders are still in flight and not yet logged. IDs already in ORDER_ID_FILE
+    (e.g. from before the counter existed) are skipped as well.
+    """
+    fd = os.open(ORDER_ID_COUNTER_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    with open(fd, "r+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            data = f.read(8)
+            last_reserved = int.from_bytes(data, "big") if len(data) == 8 else 0
+            first_id = max(last_reserved, read_last_logged_order_id()) + 1
+            f.seek(0)
+            f.write((first_id + count - 1).to_bytes(8, "big"))
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return first_id
@@ -0,0 +1,86 @@
+"""
+_session.py
+
+Shared Coinbase REST client for order.py, trade.py and the webhook listener.
+One client is created per API key file and reused for every order in the process,
+so the key file is read once and all requests share a keep-alive HTTPS pool.
+Also holds the REST helpers both scripts use with that client.
+"""
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from coinbase.rest import RESTClient
+
+# HTTP keep-alive pool for the REST client: the entry, stop loss and take profit
+# orders reuse one TLS connection. Retries only cover idempotent requests.
+HTTP_POOL_SIZE = 4
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.3
+HTTP_RETRY_STATUSES = (502, 503, 504)
+
+# REST clients shared by every order placed in this process, keyed by API key file.
+_clients: Dict[str, "RESTClient"] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(key_file: str) -> "RESTClient":
+    """
+    Returns the REST client for the given API key file, creating it on first use.
+    The Coinbase SDK is imported here rather than at module level, so scripts can
+    print --help or report argument errors without loading it.
+    Raises FileNotFoundError if the key file is missing.
+    """
+    client = _clients.get(key_file)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key_file)
+            if client is None:
+                from coinbase.rest import RESTClient
+                client = RESTClient(key_file=key_file)
+                mount_http_pool(client)
+                _clients[key_file] = client
+    return client
+
+
+def mount_http_pool(client: "RESTClient") -> None:
+    """
+    Mount a keep-alive connection pool with retries on the client's requests session.
+    SDK versions that do not expose a session are left unchanged.
+    """
+    session = getattr(client, "session", None) or getattr(client, "_session", None)
+    if session is None or not hasattr(session, "mount"):
+        logging.debug("REST client has no requests session; using SDK defaults.")
+        return
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=HTTP_RETRIES, backoff_factor=HTTP_RETRY_BACKOFF,
+                          status_forcelist=HTTP_RETRY_STATUSES),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def get_order_info(client: "RESTClient", coinbase_order_id: str) -> Optional[dict]:
+    """
+    Fetch order details with the already-open REST client (no subprocess).
+    Returns the order as a dictionary, or None if it could not be retrieved.
+    """
+    try:
+        response = client.get_order(coinbase_order_id)
+    except Exception as e:
+        logging.error("Failed to fetch order info for %s: %s", coinbase_order_id, e)
+        return None
+    # The library might return either a dict or a typed object
+    if isinstance(response, dict):
+        return response.get("order")
+    order = getattr(response, "order", None)
+    if order is None or isinstance(order, dict):
+        return order
+    return order.to_dict() if hasattr(order, "to_dict") else vars(order)
@@ -303,6 +303,16 @@ async def main_async(num_records: int) -> None:
         print_table(headers_perp, rows_perp)
 
 
+def show_info(num_records: int = 3) -> None:
+    """
+    Fetch and print the latest orders, positions, and perpetuals info.
+    In-process entry point for callers that would otherwise run ./info.py.
+
+    :param num_records: Number of transactions to show for each category.
+    """
+    asyncio.run(main_async(num_records))
+
+
 def main() -> None:
     """
     Entry point for the script, handles CLI arguments and sets up logging.
@@ -325,7 +335,7 @@ def main() -> None:
     args = parser.parse_args()
     num_records: int = args.number
 
-    asyncio.run(main_async(num_records))
+    show_info(num_records)
 
 
 if __name__ == "__main__":
@@ -9,68 +9,83 @@ Output is logged and printed to console.
 """
 
 import argparse
+import atexit
 import logging
 import sys
 import json
 import os
 import re
-import subprocess
+import threading
 from datetime import datetime, timezone
-from coinbase.rest import RESTClient
-from typing import Tuple, Dict, Any, Optional
+from functools import lru_cache
+from _order_ids import ORDER_ID_FILE, reserve_order_ids
+from _log import init_logger
+from _session import get_client, get_order_info
+from order_request import OrderRequest
+from typing import TYPE_CHECKING, Tuple, Dict, Any, List, Optional, TextIO
+
+if TYPE_CHECKING:
+    from coinbase.rest import RESTClient
+
+# orjson is optional: when installed it decodes API error bodies faster.
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
 
 # --------------------------------------------------
 # CONFIGURATIONS
 # --------------------------------------------------
 ENABLE_LOGGING = True
 
+# Data files live next to this script, so importing callers (e.g. the webhook)
+# use the same key file and order log regardless of their working directory.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # If --key-file is not supplied, we will look at environment variable "API_KEY_FILE".
 # If that is also not set, default to "perpetuals_trade_cdp_api_key.json".
-DEFAULT_API_KEY_FILE = "perpetuals_trade_cdp_api_key.json"
+DEFAULT_API_KEY_FILE = os.path.join(SCRIPT_DIR, "perpetuals_trade_cdp_api_key.json")
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"  # UTC, e.g. 2025-01-05T16:51:14.102532Z
 
-ORDER_ID_FILE = "order_id.txt"
+# Matches a JSON object embedded in an exception message (may span several lines).
+_JSON_IN_ERR_RE = re.compile(r"\{.*\}", re.DOTALL)
 
 LEVERAGE = ""
 MARGIN_TYPE = ""
 
+# Append handle for ORDER_ID_FILE, opened on first write and kept for the process lifetime.
+_order_log_fh: Optional[TextIO] = None
+_order_log_lock = threading.Lock()
+
 
-def init_logger() -> None:
+def get_next_order_id() -> int:
     """
-    Initialize Python's built-in logging for console output.
-    Logging is ON by default, controlled by ENABLE_LOGGING.
+    Returns the next local order ID (e.g. 1001, 1002, etc.).
+    Each ID is reserved through the shared counter (see reserve_order_ids), so
+    a long-running process (the webhook) never reuses an ID handed out by
+    trade.py or another order.py run. Safe to call from concurrent threads.
     """
-    if ENABLE_LOGGING:
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(name)s - %(message)s"
-        )
-        logging.info("Logging is enabled.")
-    else:
-        logging.disable(logging.CRITICAL)
+    return reserve_order_ids()
 
 
-def get_next_order_id() -> int:
+def get_order_log() -> TextIO:
     """
-    Reads the last local order ID from 'order_id.txt' if available.
-    Returns the next integer ID (e.g. 1001, 1002, etc.).
+    Returns the append handle for 'order_id.txt', opening it on first use.
+    The handle is line-buffered, so each record reaches the file as soon as it
+    is written, and is closed automatically at interpreter exit.
+    Must be called with _order_log_lock held.
     """
-    last_order_id = 1000
-    if os.path.exists(ORDER_ID_FILE):
-        with open(ORDER_ID_FILE, "r") as f:
-            lines = f.read().strip().splitlines()
-            if lines:
-                last_line = lines[-1]
-                parts = last_line.split(",")
-                if len(parts) >= 1:
-                    try:
-                        last_order_id = int(parts[0])
-                    except ValueError:
-                        last_order_id = 1000
-    return last_order_id + 1
+    global _order_log_fh
+    if _order_log_fh is None:
+        _order_log_fh = open(ORDER_ID_FILE, "a", buffering=1)
+        atexit.register(_order_log_fh.close)
+    return _order_log_fh
 
 
 def write_order_log(
     local_id: int,
+    timestamp: str,
     side: str,
     product: str,
     amount: str,
@@ -82,18 +97,31 @@ def write_order_log(
     Appends a line to 'order_id.txt' in CSV format:
       local_id,timestamp,side,product,amount,status,average_filled_price,coinbase_order_id
     """
-    now_utc = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
     line = (
-        f"{local_id},{now_utc},{side},{product},{amount},"
+        f"{local_id},{timestamp},{side},{product},{amount},"
         f"{status_str},{avg_filled_price},{coinbase_order_id}\n"
     )
-    with open(ORDER_ID_FILE, "a") as f:
-        f.write(line)
+    with _order_log_lock:
+        get_order_log().write(line)
+
+
+# Valid order sides (upper-cased input -> shared constant)
+_SIDES = {"BUY": "BUY", "SELL": "SELL"}
+
+# Convenience flags (argparse dest -> --option value), applied in this order.
+_OPTION_SHORTCUTS = (
+    ("limit_gtc", "limit_gtc"),
+    ("limit_fok", "limit_fok"),
+    ("market_ioc", "market_ioc"),
+    ("limit_ioc", "limit_ioc"),
+    ("limit_gtd", "limit_gtd"),
+)
 
 
-def parse_args() -> Tuple[argparse.ArgumentParser, argparse.Namespace]:
+@lru_cache(maxsize=None)
+def build_parser() -> argparse.ArgumentParser:
     """
-    Defines and parses CLI arguments.
+    Defines the CLI arguments. The parser is built once per process and reused.
     """
     parser = argparse.ArgumentParser(
         description="Submit an order to Coinbase Advanced. Defaults to MARKET IOC."
@@ -166,19 +194,20 @@ def parse_args() -> Tuple[argparse.ArgumentParser, argparse.Namespace]:
                              "If not provided, environment variable 'API_KEY_FILE' "
                              "or default 'perpetuals_trade_cdp_api_key.json' will be used.")
 
-    args = parser.parse_args()
+    return parser
 
-    # Apply convenience flags if used
-    if args.limit_gtc:
-        args.option = "limit_gtc"
-    if args.limit_fok:
-        args.option = "limit_fok"
-    if args.market_ioc:
-        args.option = "market_ioc"
-    if args.limit_ioc:
-        args.option = "limit_ioc"
-    if args.limit_gtd:
-        args.option = "limit_gtd"
+
+def parse_args(argv: Optional[List[str]] = None) -> Tuple[argparse.ArgumentParser, argparse.Namespace]:
+    """
+    Parses CLI arguments (default: sys.argv[1:]) with the cached parser.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # Apply convenience flags if used (a later flag in _OPTION_SHORTCUTS wins)
+    for flag, option in _OPTION_SHORTCUTS:
+        if getattr(args, flag):
+            args.option = option
 
     return parser, args
 
@@ -219,88 +248,17 @@ def consolidate_args(args: argparse.Namespace, parser: argparse.ArgumentParser)
         parser.print_help()
         sys.exit(1)
 
-    return final_side.upper(), final_product.upper(), final_amount
+    side = _SIDES.get(final_side.upper())
+    if side is None:
+        logging.error(f"Invalid side '{final_side}'. Use BUY or SELL.")
+        parser.print_help()
+        sys.exit(1)
 
+    return side, final_product.upper(), final_amount
 
-def build_order_configuration(
-    order_type: str,
-    base_size: str,
-    limit_price: str = None,
-    stop_price: str = None,
-    stop_direction: str = None,
-    post_only: bool = False,
-    end_time: str = None,
-    stop_trigger_price: str = None
-) -> Dict[str, Any]:
-    """
-    Build the dictionary specifying order configuration for the REST API call.
-    """
-    if order_type == "market":
-        return {"market_market_ioc": {"base_size": base_size}}
-    elif order_type == "market_ioc":
-        return {"market_market_ioc": {"base_size": base_size}}
-    elif order_type == "limit_ioc":
-        config = {"limit_limit_ioc": {"base_size": base_size}}
-        if limit_price:
-            config["limit_limit_ioc"]["limit_price"] = limit_price
-        if post_only:
-            config["limit_limit_ioc"]["post_only"] = post_only
-        return config
-    elif order_type == "limit_gtc":
-        config = {"limit_limit_gtc": {"base_size": base_size}}
-        if limit_price:
-            config["limit_limit_gtc"]["limit_price"] = limit_price
-        if post_only:
-            config["limit_limit_gtc"]["post_only"] = post_only
-        return config
-    elif order_type == "limit_gtd":
-        config = {"limit_limit_gtd": {"base_size": base_size, "end_time": end_time}}
-        if limit_price:
-            config["limit_limit_gtd"]["limit_price"] = limit_price
-        if post_only:
-            config["limit_limit_gtd"]["post_only"] = post_only
-        return config
-    elif order_type == "limit_fok":
-        config = {"limit_limit_fok": {"base_size": base_size}}
-        if limit_price:
-            config["limit_limit_fok"]["limit_price"] = limit_price
-        if post_only:
-            config["limit_limit_fok"]["post_only"] = post_only
-        return config
-    elif order_type == "stop_limit_gtc":
-        config = {"stop_limit_stop_limit_gtc": {"base_size": base_size}}
-        if limit_price:
-            config["stop_limit_stop_limit_gtc"]["limit_price"] = limit_price
-        if stop_price:
-            config["stop_limit_stop_limit_gtc"]["stop_price"] = stop_price
-        if stop_direction:
-            config["stop_limit_stop_limit_gtc"]["stop_direction"] = stop_direction
-        return config
-    elif order_type == "stop_limit_gtd":
-        config = {"stop_limit_stop_limit_gtd": {"base_size": base_size, "end_time": end_time}}
-        if limit_price:
-            config["stop_limit_stop_limit_gtd"]["limit_price"] = limit_price
-        if stop_price:
-            config["stop_limit_stop_limit_gtd"]["stop_price"] = stop_price
-        if stop_direction:
-            config["stop_limit_stop_limit_gtd"]["stop_direction"] = stop_direction
-        return config
-    elif order_type == "bracket_gtc":
-        config = {"trigger_bracket_gtc": {"base_size": base_size}}
-        if limit_price:
-            config["trigger_bracket_gtc"]["limit_price"] = limit_price
-        if stop_trigger_price:
-            config["trigger_bracket_gtc"]["stop_trigger_price"] = stop_trigger_price
-        return config
-    elif order_type == "bracket_gtd":
-        config = {"trigger_bracket_gtd": {"base_size": base_size, "end_time": end_time}}
-        if limit_price:
-            config["trigger_bracket_gtd"]["limit_price"] = limit_price
-        if stop_trigger_price:
-            config["trigger_bracket_gtd"]["stop_trigger_price"] = stop_trigger_price
-        return config
-    else:
-        raise ValueError(f"Unsupported --option '{order_type}'.")
+
+# Error fields checked for a failure reason, most specific first.
+_FAILURE_REASON_KEYS = ("preview_failure_reason", "message", "error_details", "error")
 
 
 def parse_failure_reason(response_obj) -> str:
@@ -313,93 +271,72 @@ def parse_failure_reason(response_obj) -> str:
 
     err = response_obj.error_response
     if isinstance(err, dict):
-        return (
-            err.get("preview_failure_reason")
-            or err.get("message")
-            or err.get("error_details")
-            or err.get("error")
-            or "UNKNOWN"
-        )
+        get = err.get
     else:
-        return (
-            getattr(err, "preview_failure_reason", None)
-            or getattr(err, "message", None)
-            or getattr(err, "error_details", None)
-            or getattr(err, "error", None)
-            or "UNKNOWN"
-        )
+        def get(key: str) -> Any:
+            return getattr(err, key, None)
+    for key in _FAILURE_REASON_KEYS:
+        reason = get(key)
+        if reason:
+            return reason
+    return "UNKNOWN"
 
 
-def run_order_info_script(coinbase_order_id: str) -> Optional[dict]:
+def load_json_object(text: Any) -> Optional[dict]:
     """
-    Run './order_info.py <coinbase_order_id>' in a subprocess,
-    parse the JSON from the "[INFO] Order info: { ... }" line,
-    return the parsed dict. If error, returns None.
+    Returns text decoded as a JSON object, or None if it is not one.
     """
-    cmd = ["./order_info.py", coinbase_order_id]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    except FileNotFoundError:
-        logging.error("order_info.py not found or not executable.")
+        obj = _json.loads(text)
+    except (TypeError, ValueError):
         return None
+    return obj if isinstance(obj, dict) else None
 
-    if result.returncode != 0:
-        logging.warning(f"order_info.py returned code {result.returncode}")
 
-    for line in result.stdout.splitlines():
-        match = re.search(r"Order info:\s+(\{.*\})", line)
-        if match:
-            info_json = match.group(1)
-            try:
-                info_dict = json.loads(info_json)
-                return info_dict
-            except json.JSONDecodeError:
-                logging.error("Failed to parse JSON from order_info.py output.")
-                return None
-    return None
+def parse_exception_reason(exc: Exception) -> str:
+    """
+    Extracts a meaningful error message from an exception raised while placing an order.
+    The HTTP response body attached to the exception (e.g. requests.HTTPError.response)
+    is used first; only when that is not JSON is the exception message scanned for an
+    embedded JSON error body. Otherwise the exception text is returned.
+    """
+    text = str(exc)
+    payload = (
+        getattr(getattr(exc, "response", None), "text", None)
+        or getattr(exc, "message", None)
+        or text
+    )
+    err = load_json_object(payload)
+    if err is None:
+        match = _JSON_IN_ERR_RE.search(text)
+        err = load_json_object(match.group(0)) if match else None
+
+    if err is None:
+        return text
+    for key in _FAILURE_REASON_KEYS:
+        if err.get(key):
+            return err[key]
+    return text
 
 
-def place_order(side: str, product: str, amount: str, args: argparse.Namespace) -> None:
+def submit_order(
+    client: "RESTClient",
+    side: str,
+    product: str,
+    amount: str,
+    order_config: Dict[str, Any]
+) -> Dict[str, Any]:
     """
-    Places the order, logs the result to 'order_id.txt', and fetches fill price.
-    In the end, prints a JSON object with fields:
+    Places one order with an existing client, logs the result to 'order_id.txt',
+    and fetches the fill price. Returns a dict with fields:
       local_order_id, coinbase_order_id, average_filled_price, status, timestamp, exit_code
-    If an order fails, exit_code=1 and the script exits with 1.
+    exit_code is 1 if the order failed.
     """
-    now_utc = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-    post_only_bool = (args.post_only.lower() == "true") if args.post_only else False
-
-    # Build final JSON config
-    order_config = build_order_configuration(
-        order_type=args.option,
-        base_size=amount,
-        limit_price=args.limit_price,
-        stop_price=args.stop_price,
-        stop_direction=args.stop_direction,
-        post_only=post_only_bool,
-        end_time=args.end_time,
-        stop_trigger_price=args.stop_trigger_price
-    )
-
+    now_utc = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
     local_id = get_next_order_id()
-    logging.info(f"Order configuration: {order_config}")
+    logging.info("Order configuration: %s", order_config)
     logging.info(f"Generated Client Order ID: {local_id}")
 
-    # Determine which key file to use
-    api_key_file = (
-        args.key_file  # --key-file on the command line
-        or os.environ.get("API_KEY_FILE")  # environment variable
-        or DEFAULT_API_KEY_FILE  # final fallback
-    )
-
-    # Create REST client
-    try:
-        client = RESTClient(key_file=api_key_file)
-    except FileNotFoundError:
-        logging.error(f"API key file '{api_key_file}' not found. "
-                      "Please specify via --key-file or set API_KEY_FILE env var.")
-        sys.exit(1)
-
     optional_params: Dict[str, str] = {}
     if LEVERAGE:
         optional_params["leverage"] = LEVERAGE
@@ -421,8 +358,8 @@ def place_order(side: str, product: str, amount: str, args: argparse.Namespace)
             order_configuration=order_config,
             **optional_params
         )
-        logging.info("Server response:")
-        logging.info(str(response))
+        # Full response is only rendered when DEBUG logging is enabled.
+        logging.debug("Server response: %s", response)
 
         if not response.success:
             reason = parse_failure_reason(response)
@@ -438,17 +375,17 @@ def place_order(side: str, product: str, amount: str, args: argparse.Namespace)
 
     except Exception as e:
         logging.error(f"Error placing the order: {e}")
-        status_str = f"failed_{e}"
+        status_str = f"failed_{parse_exception_reason(e)}"
         exit_code = 1
 
     # If it was successful, we can fetch the average_filled_price
     if not status_str.startswith("failed") and coinbase_order_id:
-        info_dict = run_order_info_script(coinbase_order_id)
+        info_dict = get_order_info(client, coinbase_order_id)
         if info_dict and "average_filled_price" in info_dict:
             avg_fill_price_str = str(info_dict["average_filled_price"])
-            logging.info(f"Fetched average_filled_price={avg_fill_price_str} from order_info.py")
+            logging.info(f"Fetched average_filled_price={avg_fill_price_str}")
         else:
-            logging.info("Could not retrieve average_filled_price from order_info.py output.")
+            logging.info("Could not retrieve average_filled_price for the order.")
 
     # Convert None-> empty strings for logging CSV
     coinbase_order_id_str = coinbase_order_id if coinbase_order_id else ""
@@ -457,6 +394,7 @@ def place_order(side: str, product: str, amount: str, args: argparse.Namespace)
     # Write local CSV log
     write_order_log(
         local_id=local_id,
+        timestamp=now_utc,
         side=side,
         product=product,
         amount=amount,
@@ -465,8 +403,7 @@ def place_order(side: str, product: str, amount: str, args: argparse.Namespace)
         coinbase_order_id=coinbase_order_id_str
     )
 
-    # Build final JSON output
-    json_output = {
+    return {
         "local_order_id": local_id,
         "coinbase_order_id": coinbase_order_id,
         "average_filled_price": avg_fill_price_str,
@@ -475,18 +412,57 @@ def place_order(side: str, product: str, amount: str, args: argparse.Namespace)
         "exit_code": exit_code
     }
 
-    print(json.dumps(json_output))
 
-    # Finally, exit with the correct code
-    if exit_code != 0:
-        sys.exit(exit_code)
+def place_order(req: OrderRequest, key_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Submits a single order in-process, e.g. from the webhook.
+    Returns the submit_order() result dict. Raises FileNotFoundError if the API key
+    file is missing and ValueError for an unsupported option.
+    """
+    order_config = req.order_configuration()
+
+    # Determine which key file to use
+    api_key_file = (
+        key_file  # --key-file on the command line
+        or os.environ.get("API_KEY_FILE")  # environment variable
+        or DEFAULT_API_KEY_FILE  # final fallback
+    )
+
+    # Get (or create) the shared REST client
+    client = get_client(api_key_file)
+    return submit_order(client, req.side, req.product, req.size, order_config)
 
 
 def main() -> None:
-    init_logger()
+    init_logger(ENABLE_LOGGING)
     parser, args = parse_args()
     side, product, amount = consolidate_args(args, parser)
-    place_order(side, product, amount, args)
+    post_only_bool = (args.post_only.lower() == "true") if args.post_only else False
+
+    req = OrderRequest(
+        side=side,
+        product=product,
+        size=amount,
+        option=args.option,
+        limit_price=args.limit_price,
+        stop_price=args.stop_price,
+        stop_direction=args.stop_direction,
+        post_only=post_only_bool,
+        end_time=args.end_time,
+        stop_trigger_price=args.stop_trigger_price
+    )
+    try:
+        json_output = place_order(req, key_file=args.key_file)
+    except FileNotFoundError as e:
+        logging.error(f"API key file not found: {e}. "
+                      "Please specify via --key-file or set API_KEY_FILE env var.")
+        sys.exit(1)
+
+    print(json.dumps(json_output))
+
+    # Finally, exit with the correct code
+    if json_output["exit_code"] != 0:
+        sys.exit(json_output["exit_code"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+"""
+order_config.py
+
+Builds the `order_configuration` payload for Coinbase Advanced `create_order` calls.
+Shared by order.py and the webhook listener, so both send identical order layouts.
+"""
+
+from typing import Tuple, Dict, Any
+
+# Optional field values that are left out of the order configuration.
+# post_only=False is omitted on purpose: it is the API default.
+_UNSET = (None, False, "")
+
+# order_type -> (configuration key, fields always sent, fields sent only when set)
+_ORDER_SPEC: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = {
+    "market": ("market_market_ioc", ("base_size",), ()),
+    "market_ioc": ("market_market_ioc", ("base_size",), ()),
+    "limit_ioc": ("limit_limit_ioc", ("base_size",), ("limit_price", "post_only")),
+    "limit_gtc": ("limit_limit_gtc", ("base_size",), ("limit_price", "post_only")),
+    "limit_gtd": ("limit_limit_gtd", ("base_size", "end_time"), ("limit_price", "post_only")),
+    "limit_fok": ("limit_limit_fok", ("base_size",), ("limit_price", "post_only")),
+    "stop_limit_gtc": ("stop_limit_stop_limit_gtc", ("base_size",),
+                       ("limit_price", "stop_price", "stop_direction")),
+    "stop_limit_gtd": ("stop_limit_stop_limit_gtd", ("base_size", "end_time"),
+                       ("limit_price", "stop_price", "stop_direction")),
+    "bracket_gtc": ("trigger_bracket_gtc", ("base_size",), ("limit_price", "stop_trigger_price")),
+    "bracket_gtd": ("trigger_bracket_gtd", ("base_size", "end_time"),
+                    ("limit_price", "stop_trigger_price")),
+}
+
+
+def build_order_configuration(
+    order_type: str,
+    base_size: str,
+    limit_price: str = None,
+    stop_price: str = None,
+    stop_direction: str = None,
+    post_only: bool = False,
+    end_time: str = None,
+    stop_trigger_price: str = None
+) -> Dict[str, Any]:
+    """
+    Build the dictionary specifying order configuration for the REST API call.
+    The layout of each order type is looked up in _ORDER_SPEC.
+    """
+    try:
+        config_key, required_fields, optional_fields = _ORDER_SPEC[order_type]
+    except KeyError:
+        raise ValueError(f"Unsupported --option '{order_type}'.") from None
+
+    values = {
+        "base_size": base_size,
+        "limit_price": limit_price,
+        "stop_price": stop_price,
+        "stop_direction": stop_direction,
+        "post_only": post_only,
+        "end_time": end_time,
+        "stop_trigger_price": stop_trigger_price,
+    }
+    return {config_key: {
+        field: values[field]
+        for field in required_fields + optional_fields
+        if field in required_fields or values[field] not in _UNSET
+    }}
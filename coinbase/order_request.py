@@ -0,0 +1,42 @@
+"""
+order_request.py
+
+Typed description of a single order, passed directly to `order.place_order`
+instead of formatting CLI strings for order.py to parse back.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from order_config import build_order_configuration
+
+
+@dataclass(frozen=True, slots=True)
+class OrderRequest:
+    """
+    One order to submit. Prices and sizes are kept as the strings sent to the API.
+    `option` is one of the order types supported by build_order_configuration.
+    """
+    side: str
+    product: str
+    size: str
+    option: str = "market"
+    limit_price: Optional[str] = None
+    stop_price: Optional[str] = None
+    stop_direction: Optional[str] = None
+    post_only: bool = False
+    end_time: Optional[str] = None
+    stop_trigger_price: Optional[str] = None
+
+    def order_configuration(self) -> Dict[str, Any]:
+        """Build the `order_configuration` payload for this request."""
+        return build_order_configuration(
+            order_type=self.option,
+            base_size=self.size,
+            limit_price=self.limit_price,
+            stop_price=self.stop_price,
+            stop_direction=self.stop_direction,
+            post_only=self.post_only,
+            end_time=self.end_time,
+            stop_trigger_price=self.stop_trigger_price
+        )
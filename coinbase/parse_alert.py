@@ -22,18 +22,43 @@ Examples:
     
     # With both stop loss and take profit
     ./parse_alert.py "BUY;SOLUSDC;1.5432;20.123;25.678"
+
+Library use:
+    `parse_alert` is a pure-Python function with no C-extension dependencies, so the
+    module runs unchanged under PyPy. When many alerts are processed (e.g. replaying a
+    batch of alerts), import `parse_alert` into one long-running process - ideally under
+    PyPy, whose JIT speeds up the string/float work once warm - instead of spawning this
+    script once per alert.
 """
 
 import sys
-import re
-import json
 import logging
+from functools import lru_cache
 from typing import Optional, Dict, Union
 
-# Set up console logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
+# Valid alert actions (upper-cased input -> shared lower-case constant)
+_ACTIONS = {"BUY": "buy", "SELL": "sell"}
+
+# Quote currencies stripped from standard tickers, checked in this order
+_QUOTE_SUFFIXES = ("USDC", "USDT", "USD")
+
+def _is_number(value: str) -> bool:
+    """
+    Return True for unsigned integers or decimals ('1', '1.5', '1.', '.5').
+    Signs, exponents, 'inf' and 'nan' are rejected.
+    """
+    return value.replace('.', '', 1).isdecimal()
+
+# Characters allowed in a ticker
+_TICKER_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-"
+
+def _is_ticker(value: str) -> bool:
+    """Return True for non-empty tickers made of ASCII letters, digits and dashes."""
+    return bool(value) and not value.strip(_TICKER_CHARS)
+
+@lru_cache(maxsize=256)
 def process_ticker(ticker: str) -> str:
     """
     Processes the ticker string, accepting both formats:
@@ -45,17 +70,19 @@ def process_ticker(ticker: str) -> str:
 
     Returns:
         str: The processed ticker with -PERP-INTX suffix.
+
+    Results are memoized, since alerts keep repeating the same few symbols.
     """
     # Check if already in correct format
     if ticker.endswith('-PERP-INTX'):
         return ticker
 
     # Process standard format
-    suffixes = ["USDC", "USDT", "USD"]
-    for suffix in suffixes:
-        if ticker.endswith(suffix):
-            ticker = ticker[:-len(suffix)]
-            break
+    if ticker.endswith(_QUOTE_SUFFIXES):
+        for suffix in _QUOTE_SUFFIXES:
+            if ticker.endswith(suffix):
+                ticker = ticker.removesuffix(suffix)
+                break
     return f"{ticker}-PERP-INTX"
 
 def parse_alert(alert_line: str) -> Optional[Dict[str, Union[str, int, float]]]:
@@ -66,51 +93,50 @@ def parse_alert(alert_line: str) -> Optional[Dict[str, Union[str, int, float]]]:
     - "BUY;SOLUSDC;1"
     - "BUY;SOL-PERP-INTX;1.5432;23.456"
     - "BUY;SOL-PERP-INTX;1;23;25"
+    Whitespace is allowed after each ';', but not before ';' or around the action.
+    A single trailing newline is ignored.
     """
-    # Updated regex to handle both integers and decimals
-    pattern = re.compile(
-        r'^(BUY|SELL);\s*([A-Z0-9-]+);\s*(\d+\.?\d*|\.\d+)(?:;\s*(\d+\.?\d*|\.\d+))?(?:;\s*(\d+\.?\d*|\.\d+))?$',
-        re.IGNORECASE
-    )
-    
-    match = pattern.search(alert_line)
-    if not match:
+    parts = alert_line.removesuffix('\n').split(';')
+    if not 3 <= len(parts) <= 5:
         logger.error("Failed to parse the alert line: %s", alert_line)
         return None
 
-    action, ticker, qty, sl, tp = match.groups()
+    action = _ACTIONS.get(parts[0].upper())
+    ticker, *numbers = [part.lstrip() for part in parts[1:]]
+    if action is None or not _is_ticker(ticker) or not all(map(_is_number, numbers)):
+        logger.error("Failed to parse the alert line: %s", alert_line)
+        return None
 
     try:
-        # Parse position value
-        position_value = float(qty)
-        
-        result: Dict[str, Union[str, int, float]] = {
-            'action': action.lower(),
-            'ticker': process_ticker(ticker),
-            'position': position_value
-        }
-
-        # Add stop loss if provided
-        if sl is not None:
-            sl_value = float(sl)
-            result['stop_loss'] = round(sl_value, 3)
-
-        # Add take profit if provided
-        if tp is not None:
-            if sl is None:
-                logger.error("Take profit provided without stop loss")
-                return None
-            tp_value = float(tp)
-            result['take_profit'] = round(tp_value, 3)
-
-        logger.info("Parsed result: %s", result)
-        return result
-
+        values = [float(number) for number in numbers]
     except ValueError as e:
         logger.error("Error parsing numeric values: %s", str(e))
         return None
 
+    result: Dict[str, Union[str, int, float]] = {
+        'action': action,
+        'ticker': process_ticker(ticker),
+        'position': values[0]
+    }
+
+    # Add stop loss if provided
+    if len(values) > 1:
+        result['stop_loss'] = round(values[1], 3)
+
+    # Add take profit if provided
+    if len(values) > 2:
+        result['take_profit'] = round(values[2], 3)
+
+    logger.info("Parsed result: %s", result)
+    return result
+
 def main() -> None:
+    # Only the CLI needs json; keep it out of the library import path.
+    import json
+
+    # Set up console logging
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
     if len(sys.argv) != 2:
         logger.error("Usage: %s 'alert text'", sys.argv[0])
         sys.exit(1)
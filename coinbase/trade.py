@@ -5,20 +5,27 @@ trade.py
 Automates a common trading pattern (entry + stop-loss + take profit) by placing orders in sequence
 
 
-This script places three consecutive orders:
+This script places three orders:
   1. An entry market order.
   2. A stop loss order.
   3. A take profit order.
+Once the entry order has filled, the stop loss and take profit orders are sent concurrently
+(asyncio.gather over the blocking REST calls).
+Transient errors (connection errors, timeouts, HTTP 5xx and 429) are retried with the same
+client order ID. If the stop loss still cannot be placed, the take profit is cancelled and
+the position is closed with a market order.
 
 The take profit price is automatically calculated based on the entry price
 and the supplied stop loss price using a risk/reward ratio (default 2.0).
 
 The stop loss order uses a 0.5% buffer:
-  - For LONG positions, the trigger remains as supplied while the limit price is 0.5% lower.
-  - For SHORT positions, the trigger remains as supplied while the limit price is 0.5% higher.
+  - For LONG positions, the trigger is the supplied price while the limit price is 0.5% lower.
+  - For SHORT positions, the trigger is the supplied price while the limit price is 0.5% higher.
+All exit prices are snapped to the product's price tick; the take profit, the risk check and
+the summary use the snapped trigger that is actually sent.
 
-Price values for entry and take profit orders are formatted to 4 decimals,
-while stop loss order prices are formatted to 3 decimals.
+Prices are sent exactly on the product's tick. If the tick cannot be fetched, take profit
+prices are rounded to 4 decimals and stop loss order prices to 3 decimals instead.
 
 At the end, a concise financial summary is printed (without log prefixes).
 
@@ -35,26 +42,49 @@ Notes:
 - The take profit price is calculated using:
     For LONG: take_profit = entry_price + (entry_price - stop_loss_price) * rr_ratio
     For SHORT: take_profit = entry_price - (stop_loss_price - entry_price) * rr_ratio
+- Callers that already hold the trade parameters (e.g. a webhook handler) can import
+  `run_trade` (or await `run_trade_async`) directly instead of going through CLI
+  argument parsing.
+- Setting TRADE_CPU (e.g. TRADE_CPU=3) pins the process to that core and runs it under
+  SCHED_FIFO, so it is not descheduled while orders are placed. Real-time scheduling
+  needs CAP_SYS_NICE (or root); without it only the pinning is applied. Linux only.
 """
 
 import argparse
+import atexit
 import logging
+import math
 import sys
 import os
-import subprocess
-import re
-import json
+import threading
+import time
 from datetime import datetime, timezone
-from coinbase.rest import RESTClient
-from typing import Dict, Any, Optional
+from decimal import Decimal, InvalidOperation, ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_EVEN
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
+
+from _order_ids import ORDER_ID_FILE, reserve_order_ids
+from _log import init_logger
+from _session import get_client, get_order_info
+
+if TYPE_CHECKING:
+    from coinbase.rest import RESTClient
 
 # --------------------------------------------------
 # HELPER FUNCTIONS FOR FORMATTING
 # --------------------------------------------------
+# Fixed-point format specs for precisions 0-8, so format_float does not rebuild
+# the spec string on every call.
+_FLOAT_SPECS = tuple(f".{precision}f" for precision in range(9))
+
 def format_float(value: float, precision: int) -> str:
     """Format a float with a given precision, removing unnecessary trailing zeroes."""
-    s = f"{value:.{precision}f}"
-    return s.rstrip('0').rstrip('.') if '.' in s else s
+    spec = _FLOAT_SPECS[precision] if precision < len(_FLOAT_SPECS) else f".{precision}f"
+    s = format(value, spec)
+    # Only strip when there is a trailing zero to remove (most prices have none).
+    if s[-1] == '0' and '.' in s:
+        s = s.rstrip('0').rstrip('.')
+    return s
 
 def format_percent(value: float) -> str:
     """Format a percentage value with one decimal, removing trailing zeros."""
@@ -68,7 +98,28 @@ def format_percent(value: float) -> str:
 # --------------------------------------------------
 ENABLE_LOGGING = True
 API_KEY_FILE = "perpetuals_trade_cdp_api_key.json"
-ORDER_ID_FILE = "order_id.txt"
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"  # UTC, e.g. 2025-01-05T16:51:14.102532Z
+ORDER_ID_BLOCK_SIZE = 3  # IDs reserved per counter update: entry, stop loss, take profit
+
+# Attempts per order on transient errors, with exponential backoff (seconds).
+# Every attempt reuses the order's client_order_id, so Coinbase does not place it twice.
+ORDER_ATTEMPTS = 3
+ORDER_RETRY_BACKOFF = 0.05
+RETRY_STATUSES = (429,)  # retried besides 5xx (rate limited)
+
+# A market order may not have filled yet when it is first read back; its fill price
+# is polled up to FILL_POLL_ATTEMPTS times, FILL_POLL_INTERVAL seconds apart.
+FILL_POLL_ATTEMPTS = 10
+FILL_POLL_INTERVAL = 0.1
+# Order statuses after which the fill price no longer changes.
+_FINAL_ORDER_STATUSES = frozenset({"FILLED", "CANCELLED", "EXPIRED", "FAILED"})
+# Final statuses that, without a fill price, mean nothing was filled.
+_UNFILLED_FINAL_STATUSES = _FINAL_ORDER_STATUSES - {"FILLED"}
+
+# Optional CPU pinning: set TRADE_CPU to a core number (ideally one isolated with the
+# isolcpus= kernel argument) to pin the process there with SCHED_FIFO at this priority.
+TRADE_CPU_ENV = "TRADE_CPU"
+TRADE_RT_PRIORITY = 20
 
 # Optional parameters (if needed by your account)
 LEVERAGE = ""
@@ -79,41 +130,66 @@ STOP_LOSS_BUFFER_PERCENT = 0.5    # 0.5% buffer for stop loss orders
 PRICE_PRECISION = 4               # 4 decimals for entry and take profit orders
 STOP_LOSS_PRICE_PRECISION = 3     # 3 decimals for stop loss orders
 
+# Trade side -> (entry side, exit side, stop loss trigger direction, price sign)
+# The sign is +1 for LONG and -1 for SHORT: profit lies in the direction of sign.
+_SIDE_MAP = {
+    "LONG": ("BUY", "SELL", "STOP_DIRECTION_STOP_DOWN", 1.0),
+    "BUY": ("BUY", "SELL", "STOP_DIRECTION_STOP_DOWN", 1.0),
+    "SHORT": ("SELL", "BUY", "STOP_DIRECTION_STOP_UP", -1.0),
+    "SELL": ("SELL", "BUY", "STOP_DIRECTION_STOP_UP", -1.0),
+}
+
+# Order price formatters, built once from the precisions above.
+_FMT_PRICE = f"{{:.{PRICE_PRECISION}f}}".format
+
+# Price grids used instead of the product's tick when it could not be fetched.
+_PRICE_GRID = Decimal(1).scaleb(-PRICE_PRECISION)
+_STOP_GRID = Decimal(1).scaleb(-STOP_LOSS_PRICE_PRECISION)
+
+# Trade plan logged once the entry has filled, as a single log record.
+_PLAN_TEMPLATE = (
+    "Computed take profit price: {take_profit} based on entry price: {entry} "
+    "and risk reward ratio: {rr_ratio}\n"
+    "Using stop loss trigger: {stop_trigger} and limit: {stop_limit} for a {side} position.\n"
+    "\n===== STOP LOSS + TAKE PROFIT ORDERS ====="
+)
+
+# Guards ORDER_ID_FILE writes, since the stop loss and take profit orders
+# are placed from concurrent threads.
+_order_log_lock = threading.Lock()
+_pending_log_lines: List[str] = []  # written out by flush_order_log()
+
+# Block of local order IDs reserved by this process: next ID to hand out and the
+# last reserved one. Empty until the first order.
+_order_id_lock = threading.Lock()
+_next_order_id = 1
+_last_reserved_order_id = 0
+
+# Price ticks by (client, product), filled by get_price_increment on successful lookups.
+_price_increments: Dict[Tuple["RESTClient", str], Decimal] = {}
+
 # --------------------------------------------------
-# LOGGING AND ORDER LOGGING
+# ORDER IDS AND ORDER LOGGING
 # --------------------------------------------------
-def init_logger() -> None:
-    """Initialize console logging."""
-    if ENABLE_LOGGING:
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(name)s - %(message)s"
-        )
-        logging.info("Logging is enabled.")
-    else:
-        logging.disable(logging.CRITICAL)
-
 def get_next_order_id() -> int:
     """
-    Read the last local order ID from ORDER_ID_FILE and return the next ID.
-    Starts at 1000 if no file exists.
-    """
-    last_order_id = 1000
-    if os.path.exists(ORDER_ID_FILE):
-        with open(ORDER_ID_FILE, "r") as f:
-            lines = f.read().strip().splitlines()
-            if lines:
-                last_line = lines[-1]
-                parts = last_line.split(",")
-                if len(parts) >= 1:
-                    try:
-                        last_order_id = int(parts[0])
-                    except ValueError:
-                        last_order_id = 1000
-    return last_order_id + 1
+    Return the next local order ID.
+    IDs are reserved ORDER_ID_BLOCK_SIZE at a time (see reserve_order_ids) and
+    handed out from memory, so a whole trade costs a single counter-file update.
+    IDs left unused when the process exits are skipped.
+    """
+    global _next_order_id, _last_reserved_order_id
+    with _order_id_lock:
+        if _next_order_id > _last_reserved_order_id:
+            _next_order_id = reserve_order_ids(ORDER_ID_BLOCK_SIZE)
+            _last_reserved_order_id = _next_order_id + ORDER_ID_BLOCK_SIZE - 1
+        order_id = _next_order_id
+        _next_order_id += 1
+    return order_id
 
 def write_order_log(
     local_id: int,
+    timestamp: str,
     order_type: str,
     side: str,
     product: str,
@@ -123,28 +199,46 @@ def write_order_log(
     coinbase_order_id: str = ""
 ) -> None:
     """
-    Append a CSV-formatted line to ORDER_ID_FILE with the order details.
+    Queue a CSV-formatted line for ORDER_ID_FILE with the order details.
+    Lines are written in one batch by flush_order_log().
     Format:
       local_id,timestamp,order_type,side,product,size,status,average_filled_price,coinbase_order_id
     """
-    now_utc = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
     line = (
-        f"{local_id},{now_utc},{order_type},{side},{product},{size},"
+        f"{local_id},{timestamp},{order_type},{side},{product},{size},"
         f"{status_str},{avg_filled_price},{coinbase_order_id}\n"
     )
-    with open(ORDER_ID_FILE, "a") as f:
-        f.write(line)
+    with _order_log_lock:
+        _pending_log_lines.append(line)
+
+def flush_order_log() -> None:
+    """
+    Write all pending order log lines to ORDER_ID_FILE with one write() and fsync.
+    Called at the end of every trade (see run_trade_async) and again at interpreter exit.
+    """
+    with _order_log_lock:
+        if not _pending_log_lines:
+            return
+        with open(ORDER_ID_FILE, "a") as f:
+            f.write("".join(_pending_log_lines))
+            f.flush()
+            os.fsync(f.fileno())
+        _pending_log_lines.clear()
+
+atexit.register(flush_order_log)
 
 # --------------------------------------------------
 # ARGUMENT PARSING
 # --------------------------------------------------
-def parse_args() -> argparse.Namespace:
+@lru_cache(maxsize=None)
+def build_parser() -> argparse.ArgumentParser:
+    """Build the CLI parser once per process; repeated parse_args() calls reuse it."""
     parser = argparse.ArgumentParser(
         description="Execute entry, stop loss, and take profit orders consecutively."
     )
-    parser.add_argument("--side", required=True,
-                        help="Position side: LONG or SHORT.")
-    parser.add_argument("--product", required=True,
+    parser.add_argument("--side", required=True, type=str.upper, choices=list(_SIDE_MAP),
+                        help="Position side: LONG or SHORT (BUY/SELL also accepted; case-insensitive).")
+    parser.add_argument("--product", required=True, type=str.upper,
                         help="Instrument code, e.g., NEO-PERP-INTX.")
     parser.add_argument("--size", required=True,
                         help="Order size (quantity) to trade.")
@@ -152,7 +246,27 @@ def parse_args() -> argparse.Namespace:
                         help="Price at which the stop loss order should trigger.")
     parser.add_argument("--rr-ratio", required=False, type=float, default=2.0,
                         help="Risk reward ratio for take profit calculation (default 2.0).")
-    return parser.parse_args()
+    return parser
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse argv (default: sys.argv[1:]) with the cached parser.
+    Obviously invalid numbers are rejected here, before any order is sent.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        size = float(args.size)
+    except ValueError:
+        parser.error(f"--size must be a number, got '{args.size}'.")
+    # isfinite also rejects inf and nan, which compare oddly and would be sent as-is.
+    if not (math.isfinite(size) and size > 0):
+        parser.error("--size must be a finite number greater than 0.")
+    if not (math.isfinite(args.stop_loss_price) and args.stop_loss_price > 0):
+        parser.error("--stop-loss-price must be a finite number greater than 0.")
+    if not (math.isfinite(args.rr_ratio) and args.rr_ratio > 0):
+        parser.error("--rr-ratio must be a finite number greater than 0.")
+    return args
 
 # --------------------------------------------------
 # ORDER CONFIGURATION BUILDERS
@@ -160,8 +274,8 @@ def parse_args() -> argparse.Namespace:
 def build_order_configuration(
     order_type: str,
     size: str,
-    price: Optional[float] = None,
-    stop_price: Optional[float] = None,
+    price: Optional[str] = None,
+    stop_price: Optional[str] = None,
     stop_direction: Optional[str] = None
 ) -> Dict[str, Any]:
     """
@@ -171,24 +285,24 @@ def build_order_configuration(
       - "stop_loss" for a stop-limit order,
       - "take_profit" for a limit order.
       
-    Price fields are converted to strings formatted with the appropriate precision.
-    For stop loss orders, we use STOP_LOSS_PRICE_PRECISION; otherwise, PRICE_PRECISION.
+    Price fields are passed already formatted (see snap_to_increment), so the
+    strings sent to the API are the ones that were logged.
     """
     if order_type == "market":
         return {"market_market_ioc": {"base_size": size}}
     elif order_type == "stop_loss":
         config = {"stop_limit_stop_limit_gtc": {"base_size": size}}
         if price is not None:
-            config["stop_limit_stop_limit_gtc"]["limit_price"] = f"{price:.{STOP_LOSS_PRICE_PRECISION}f}"
+            config["stop_limit_stop_limit_gtc"]["limit_price"] = price
         if stop_price is not None:
-            config["stop_limit_stop_limit_gtc"]["stop_price"] = f"{stop_price:.{STOP_LOSS_PRICE_PRECISION}f}"
+            config["stop_limit_stop_limit_gtc"]["stop_price"] = stop_price
         if stop_direction:
             config["stop_limit_stop_limit_gtc"]["stop_direction"] = stop_direction
         return config
     elif order_type == "take_profit":
         config = {"limit_limit_gtc": {"base_size": size}}
         if price is not None:
-            config["limit_limit_gtc"]["limit_price"] = f"{price:.{PRICE_PRECISION}f}"
+            config["limit_limit_gtc"]["limit_price"] = price
         return config
     else:
         raise ValueError(f"Unsupported order type '{order_type}'.")
@@ -196,6 +310,9 @@ def build_order_configuration(
 # --------------------------------------------------
 # ERROR HANDLING AND ORDER INFO
 # --------------------------------------------------
+# Error fields checked for a failure reason, most specific first.
+_FAILURE_REASON_KEYS = ("preview_failure_reason", "message", "error_details", "error")
+
 def parse_failure_reason(response_obj) -> str:
     """
     Extract a failure reason from the API response.
@@ -204,61 +321,191 @@ def parse_failure_reason(response_obj) -> str:
         return "UNKNOWN"
     err = response_obj.error_response
     if isinstance(err, dict):
-        return (
-            err.get("preview_failure_reason")
-            or err.get("message")
-            or err.get("error_details")
-            or err.get("error")
-            or "UNKNOWN"
-        )
+        get = err.get
     else:
-        return (
-            getattr(err, "preview_failure_reason", None)
-            or getattr(err, "message", None)
-            or getattr(err, "error_details", None)
-            or getattr(err, "error", None)
-            or "UNKNOWN"
-        )
+        def get(key: str) -> Any:
+            return getattr(err, key, None)
+    for key in _FAILURE_REASON_KEYS:
+        reason = get(key)
+        if reason:
+            return reason
+    return "UNKNOWN"
+
+def wait_for_fill(client: "RESTClient", coinbase_order_id: str) -> Optional[dict]:
+    """
+    Poll the order (see get_order_info) until its average_filled_price is above 0 or
+    it reaches a final status, at most FILL_POLL_ATTEMPTS times.
+    Returns the last order details read, or None if none could be retrieved.
+    """
+    info_dict = None
+    for attempt in range(FILL_POLL_ATTEMPTS):
+        if attempt:
+            time.sleep(FILL_POLL_INTERVAL)
+        info_dict = get_order_info(client, coinbase_order_id) or info_dict
+        if not info_dict:
+            continue
+        try:
+            if float(info_dict.get("average_filled_price") or 0) > 0:
+                return info_dict
+        except (TypeError, ValueError):
+            pass
+        if info_dict.get("status") in _FINAL_ORDER_STATUSES:
+            return info_dict
+    logging.warning("Order %s has no fill price after %s attempts.", coinbase_order_id, FILL_POLL_ATTEMPTS)
+    return info_dict
 
-def run_order_info_script(coinbase_order_id: str) -> Optional[dict]:
+def get_price_increment(client: "RESTClient", product: str) -> Optional[Decimal]:
     """
-    Run the external script './order_info.py' to fetch additional order details.
-    Returns a dictionary if JSON is successfully parsed.
+    Return the product's price tick (price_increment, else quote_increment), fetched
+    once per product and process. Returns None if it could not be retrieved; failed
+    lookups are not cached, so the next trade tries again.
     """
-    cmd = ["./order_info.py", coinbase_order_id]
+    increment = _price_increments.get((client, product))
+    if increment is not None:
+        return increment
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    except FileNotFoundError:
-        logging.error("order_info.py not found or not executable.")
+        response = client.get_product(product)
+    except Exception as e:
+        logging.warning("Failed to fetch price increment for %s: %s", product, e)
         return None
-    if result.returncode != 0:
-        logging.warning(f"order_info.py returned code {result.returncode}")
-    for line in result.stdout.splitlines():
-        match = re.search(r"Order info:\s+(\{.*\})", line)
-        if match:
-            info_json = match.group(1)
-            try:
-                info_dict = json.loads(info_json)
-                return info_dict
-            except json.JSONDecodeError:
-                logging.error("Failed to parse JSON from order_info.py output.")
-                return None
-    return None
+    get = response.get if isinstance(response, dict) else (lambda key: getattr(response, key, None))
+    increment = get("price_increment") or get("quote_increment")
+    try:
+        increment = Decimal(str(increment))
+    except (InvalidOperation, TypeError):
+        return None
+    if not increment > 0:
+        return None
+    _price_increments[(client, product)] = increment
+    return increment
+
+def snap_to_increment(price: float, increment: Decimal,
+                      rounding: str = ROUND_HALF_EVEN) -> Tuple[float, str]:
+    """
+    Round price to a multiple of increment (nearest by default; ROUND_FLOOR or
+    ROUND_CEILING to round in one direction). Returns the snapped price as a float
+    and as the exact decimal string to send, so the API gets a price on the grid.
+    """
+    ticks = (Decimal(str(price)) / increment).quantize(Decimal(1), rounding=rounding)
+    snapped = ticks * increment
+    return float(snapped), format(snapped, "f")
+
+def compute_levels(sign: float, stop_loss: float, entry: float, rr_ratio: float,
+                   buffer_percent: float = STOP_LOSS_BUFFER_PERCENT) -> Tuple[float, float]:
+    """
+    Pure price math for a trade: returns (take_profit, stop_loss_limit), rounded to
+    PRICE_PRECISION and STOP_LOSS_PRICE_PRECISION, before tick snapping.
+    sign is +1.0 for LONG and -1.0 for SHORT; the stop loss must already be on the
+    losing side of the entry. Takes only scalars, so a backtest can call it in a loop.
+    """
+    # entry - stop_loss is the signed risk, so the target lies on the profit side for both sides.
+    take_profit = round(entry + (entry - stop_loss) * rr_ratio, PRICE_PRECISION)
+    stop_loss_limit = round(stop_loss * (1 - sign * buffer_percent / 100.0), STOP_LOSS_PRICE_PRECISION)
+    return take_profit, stop_loss_limit
 
 # --------------------------------------------------
 # ORDER EXECUTION
 # --------------------------------------------------
-def place_single_order(client: RESTClient, side: str, product: str, size: str,
-                       order_type: str, price: Optional[float] = None,
-                       stop_price: Optional[float] = None,
-                       stop_direction: Optional[str] = None) -> Dict[str, Any]:
+def is_transient_error(e: Exception) -> bool:
+    """
+    Return True for errors worth retrying: connection errors, timeouts and HTTP
+    errors with a 5xx or RETRY_STATUSES (429) status. Other client errors (bad auth,
+    invalid product, ...) would fail the same way again.
+    """
+    from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+    if isinstance(e, (ConnectionError, Timeout)):
+        return True
+    if isinstance(e, HTTPError):
+        status = getattr(e.response, "status_code", None)
+        return status is not None and (status in RETRY_STATUSES or 500 <= status < 600)
+    return False
+
+def create_order_with_retry(client: "RESTClient", label: str, local_id: int, **order_params: Any) -> Any:
+    """
+    Call client.create_order, retrying transient errors (see is_transient_error) up to
+    ORDER_ATTEMPTS times. The same client_order_id is sent on every attempt, so a retry
+    after a lost response returns the original order instead of placing a second one.
+    Other errors, and the last transient one, are re-raised immediately.
+    """
+    from requests.exceptions import RequestException
+
+    for attempt in range(ORDER_ATTEMPTS):
+        try:
+            return client.create_order(client_order_id=str(local_id), **order_params)
+        except RequestException as e:
+            if attempt + 1 == ORDER_ATTEMPTS or not is_transient_error(e):
+                raise
+            delay = ORDER_RETRY_BACKOFF * 2 ** attempt
+            logging.warning("Retrying %s order (local_id: %s) in %.2fs after error: %s",
+                            label, local_id, delay, e)
+            time.sleep(delay)
+
+def cancel_orders(client: "RESTClient", order_ids: List[str]) -> bool:
+    """
+    Cancel the given Coinbase orders with a single batch cancel request.
+    Returns True if every order was cancelled.
+    """
+    from requests.exceptions import RequestException
+
+    if not order_ids:
+        return True
+    try:
+        response = client.cancel_orders(order_ids=order_ids)
+    except (RequestException, ValueError) as e:
+        logging.error("Error cancelling orders %s: %s", order_ids, e)
+        return False
+    logging.info("Cancel response for orders %s: %s", order_ids, response)
+    results = getattr(response, "results", None) or []
+    return len(results) == len(order_ids) and all(
+        result.get("success") if isinstance(result, dict) else getattr(result, "success", False)
+        for result in results)
+
+def rollback_trade(client: "RESTClient", exit_side: str, product: str, size: str,
+                   placed_order_ids: List[str]) -> bool:
+    """
+    Undo a trade whose entry (may have) filled but which has no stop loss: cancel the
+    exit orders that were placed, if any (one batch request), and close the entry
+    position with a market order.
+    Returns True if the position was closed.
+    """
+    logging.error("Rolling back: cancelling orders %s and closing the position.", placed_order_ids)
+    if not cancel_orders(client, placed_order_ids):
+        logging.error("Could not cancel all exit orders %s; check them manually.", placed_order_ids)
+    close_order = place_single_order(
+        client=client,
+        side=exit_side,
+        product=product,
+        size=size,
+        order_type="market"
+    )
+    if close_order["exit_code"] != 0:
+        logging.error("Could not close the %s position; it has no stop loss.", product)
+        return False
+    return True
+
+def place_single_order(client: "RESTClient", side: str, product: str, size: str,
+                       order_type: str, price: Optional[str] = None,
+                       stop_price: Optional[str] = None,
+                       stop_direction: Optional[str] = None,
+                       local_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Place a single order using the REST API.
+    local_id is reserved here unless the caller already reserved one.
     Returns a dictionary containing details about the order.
+    Transient network/HTTP errors are retried (see create_order_with_retry); if they
+    persist, another HTTP error occurs or the response is malformed, the order is
+    recorded as failed.
+    Any other exception is a bug and propagates.
     """
-    local_id = get_next_order_id()
+    from requests.exceptions import RequestException
+
+    timestamp = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+    if local_id is None:
+        local_id = get_next_order_id()
     order_config = build_order_configuration(order_type, size, price, stop_price, stop_direction)
-    logging.info(f"Placing {order_type.upper()} order (local_id: {local_id}): {order_config}")
+    label = order_type.upper()
+    logging.info("Placing %s order (local_id: %s): %s", label, local_id, order_config)
     
     # Optional extra parameters
     optional_params: Dict[str, str] = {}
@@ -268,19 +515,23 @@ def place_single_order(client: RESTClient, side: str, product: str, size: str,
         optional_params["margin_type"] = MARGIN_TYPE
     
     coinbase_order_id = None
+    order_status = None
     avg_fill_price_str = None
+    avg_fill_price: Optional[float] = None
     exit_code = 0
     status_str = "executed"
     
     try:
-        response = client.create_order(
-            client_order_id=str(local_id),
+        response = create_order_with_retry(
+            client,
+            label,
+            local_id,
             product_id=product,
             side=side,
             order_configuration=order_config,
             **optional_params
         )
-        logging.info(f"Response for {order_type.upper()} order (local_id: {local_id}): {response}")
+        logging.info("Response for %s order (local_id: %s): %s", label, local_id, response)
         if not response.success:
             reason = parse_failure_reason(response)
             status_str = f"failed_{reason}"
@@ -291,22 +542,38 @@ def place_single_order(client: RESTClient, side: str, product: str, size: str,
                 coinbase_order_id = sr.get("order_id", None)
             else:
                 coinbase_order_id = getattr(sr, "order_id", None)
-    except Exception as e:
-        logging.error(f"Error placing {order_type.upper()} order (local_id: {local_id}): {e}")
+    except (RequestException, ValueError, KeyError) as e:
+        logging.error("Error placing %s order (local_id: %s): %s", label, local_id, e)
         status_str = f"failed_{e}"
         exit_code = 1
     
-    # Optionally, try to fetch the average filled price
+    # Optionally, try to fetch the average filled price. A market order is polled until
+    # it has filled; resting stop loss and take profit orders are read once.
     if not status_str.startswith("failed") and coinbase_order_id:
-        info_dict = run_order_info_script(coinbase_order_id)
+        if order_type == "market":
+            info_dict = wait_for_fill(client, coinbase_order_id)
+        else:
+            info_dict = get_order_info(client, coinbase_order_id)
+        order_status = info_dict.get("status") if info_dict else None
         if info_dict and "average_filled_price" in info_dict:
             avg_fill_price_str = str(info_dict["average_filled_price"])
-            logging.info(f"Fetched average_filled_price={avg_fill_price_str} for {order_type.upper()} order (local_id: {local_id})")
+            logging.info("Fetched average_filled_price=%s for %s order (local_id: %s)",
+                         avg_fill_price_str, label, local_id)
+            # Only a positive fill price is usable; "0" means the order has not filled
+            # (expected for resting stop loss and take profit orders).
+            try:
+                parsed_price = float(avg_fill_price_str)
+            except ValueError:
+                parsed_price = None
+            if parsed_price is not None and parsed_price > 0:
+                avg_fill_price = parsed_price
+            elif parsed_price is None or order_type == "market":
+                logging.error("Invalid average_filled_price for %s order (local_id: %s)", label, local_id)
         else:
-            logging.info(f"Could not retrieve average_filled_price for {order_type.upper()} order (local_id: {local_id})")
+            logging.info("Could not retrieve average_filled_price for %s order (local_id: %s)", label, local_id)
     
     # Log order details locally
-    write_order_log(local_id, order_type, side, product, size,
+    write_order_log(local_id, timestamp, order_type, side, product, size,
                     status_str,
                     avg_fill_price_str if avg_fill_price_str else "",
                     coinbase_order_id if coinbase_order_id else "")
@@ -315,161 +582,218 @@ def place_single_order(client: RESTClient, side: str, product: str, size: str,
         "local_order_id": local_id,
         "coinbase_order_id": coinbase_order_id,
         "average_filled_price": avg_fill_price_str,
+        "average_filled_price_f": avg_fill_price,  # parsed once; None unless a positive price
+        "order_status": order_status,  # Coinbase status (e.g. FILLED), None if not read
         "status": status_str,
         "exit_code": exit_code,
-        "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        "timestamp": timestamp
     }
 
 # --------------------------------------------------
-# MAIN FUNCTION
+# TRADE EXECUTION
 # --------------------------------------------------
-def main() -> None:
-    init_logger()
-    args = parse_args()
-    
+def order_result_or_failure(result: Any, local_id: int, order_type: str, side: str,
+                            product: str, size: str) -> Dict[str, Any]:
+    """
+    Return the place_single_order result, or a failed-order result if the order
+    raised instead (asyncio.gather with return_exceptions=True hands the exception back).
+    A raised order never reached write_order_log, so its failed line is logged here.
+    """
+    if not isinstance(result, BaseException):
+        return result
+    label = order_type.upper()
+    logging.error("Unexpected error placing %s order (local_id: %s): %r", label, local_id, result,
+                  exc_info=result)
+    timestamp = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+    status_str = f"failed_{result}"
+    write_order_log(local_id, timestamp, order_type, side, product, size, status_str)
+    return {
+        "local_order_id": local_id,
+        "coinbase_order_id": None,
+        "average_filled_price": None,
+        "average_filled_price_f": None,
+        "order_status": None,
+        "status": status_str,
+        "exit_code": 1,
+        "timestamp": timestamp
+    }
+
+async def run_trade_async(side: str, product: str, size: str, stop_loss_price: float,
+                          rr_ratio: float = 2.0) -> int:
+    """
+    Place the entry, stop loss and take profit orders and print the financial summary.
+    The blocking REST calls run in the default executor; the stop loss and take
+    profit orders are awaited together with asyncio.gather once the entry has filled.
+    side and product must already be upper-case, as parse_args() returns them.
+    The trade's order log lines are flushed before returning, so long-running
+    in-process callers do not hold them until interpreter exit.
+    Returns the exit code: 0 if every order succeeded, 1 otherwise.
+    """
+    try:
+        return await _run_trade_async(side, product, size, stop_loss_price, rr_ratio)
+    finally:
+        flush_order_log()
+
+async def _run_trade_async(side: str, product: str, size: str, stop_loss_price: float,
+                           rr_ratio: float) -> int:
+    """Body of run_trade_async(), without the order log flush."""
+    import asyncio
+
     # Determine order sides based on input.
-    side_input = args.side.upper()
-    if side_input in ["LONG", "BUY"]:
-        entry_side = "BUY"
-        exit_side = "SELL"
-        stop_direction = "STOP_DIRECTION_STOP_DOWN"
-    elif side_input in ["SHORT", "SELL"]:
-        entry_side = "SELL"
-        exit_side = "BUY"
-        stop_direction = "STOP_DIRECTION_STOP_UP"
-    else:
+    try:
+        entry_side, exit_side, stop_direction, sign = _SIDE_MAP[side]
+    except KeyError:
         logging.error("Invalid side. Use LONG or SHORT.")
-        sys.exit(1)
-    
-    product = args.product.upper()
-    size = args.size  # as provided
-    stop_loss_price = args.stop_loss_price
-    rr_ratio = args.rr_ratio
+        return 1
     
     # Create the REST client.
     try:
-        client = RESTClient(key_file=API_KEY_FILE)
+        client = get_client(API_KEY_FILE)
     except FileNotFoundError:
-        logging.error(f"API key file '{API_KEY_FILE}' not found.")
-        sys.exit(1)
+        logging.error("API key file '%s' not found.", API_KEY_FILE)
+        return 1
     
+    loop = asyncio.get_running_loop()
+
     # === ENTRY ORDER ===
+    # The product's price tick is fetched alongside the entry order, so exit prices
+    # can be snapped to a valid grid without an extra round trip afterwards.
     logging.info("\n===== ENTRY ORDER =====")
-    entry_order = place_single_order(
-        client=client,
-        side=entry_side,
-        product=product,
-        size=size,
-        order_type="market"
+    entry_order, price_increment = await asyncio.gather(
+        loop.run_in_executor(None, partial(
+            place_single_order,
+            client=client,
+            side=entry_side,
+            product=product,
+            size=size,
+            order_type="market"
+        )),
+        loop.run_in_executor(None, get_price_increment, client, product),
     )
     
     if entry_order["exit_code"] != 0:
         logging.error("Entry order failed. Aborting subsequent orders.")
-        sys.exit(1)
+        return 1
     
-    if not entry_order["average_filled_price"]:
-        logging.error("No average filled price returned from entry order. Cannot calculate take profit price.")
-        sys.exit(1)
+    entry_price = entry_order["average_filled_price_f"]
+    if entry_price is None:
+        logging.error("No valid average filled price returned from entry order. Cannot calculate take profit price.")
+        # An entry that ended without filling left no position; any other entry may
+        # have filled, and must not stay open without a stop loss.
+        if entry_order["order_status"] not in _UNFILLED_FINAL_STATUSES:
+            await loop.run_in_executor(None, rollback_trade, client, exit_side, product, size, [])
+        return 1
     
-    try:
-        entry_price = float(entry_order["average_filled_price"])
-    except ValueError:
-        logging.error("Invalid average filled price returned from entry order.")
-        sys.exit(1)
+    # Exit prices are snapped to the product's tick (or to the precision grids if it is
+    # unknown) and formatted once; the logs, the orders and the summary all use them.
+    price_grid = price_increment or _PRICE_GRID
+    stop_grid = price_increment or _STOP_GRID
     
-    # Calculate take profit price based on risk reward ratio.
-    if entry_side == "BUY":  # LONG position
-        risk = entry_price - stop_loss_price
-        if risk <= 0:
-            logging.error("Invalid stop loss price: it must be below the entry price for a LONG position.")
-            sys.exit(1)
-        take_profit_price = entry_price + risk * rr_ratio
-    else:  # SHORT position
-        risk = stop_loss_price - entry_price
-        if risk <= 0:
-            logging.error("Invalid stop loss price: it must be above the entry price for a SHORT position.")
-            sys.exit(1)
-        take_profit_price = entry_price - risk * rr_ratio
+    # The risk check, the other prices and the summary all use the trigger that is sent.
+    stop_loss_trigger, stop_trigger_s = snap_to_increment(stop_loss_price, stop_grid)
     
-    take_profit_price = round(take_profit_price, PRICE_PRECISION)
-    logging.info(f"Computed take profit price: {take_profit_price:.{PRICE_PRECISION}f} based on entry price: {entry_price:.{PRICE_PRECISION}f} and risk reward ratio: {rr_ratio}")
+    # The stop loss must lie on the losing side of the entry (below for LONG, above for SHORT).
+    risk = sign * (entry_price - stop_loss_trigger)
+    if risk <= 0:
+        logging.error("Invalid stop loss price: it must be %s the entry price for a %s position.",
+                      "below" if sign > 0 else "above", "LONG" if sign > 0 else "SHORT")
+        # The entry has filled, so close it rather than leave it without a stop loss.
+        await loop.run_in_executor(None, rollback_trade, client, exit_side, product, size, [])
+        return 1
     
-    # Calculate stop loss order prices with buffer.
-    buffer_decimal = STOP_LOSS_BUFFER_PERCENT / 100.0
-    if entry_side == "BUY":  # LONG: trigger remains; limit is lower.
-        stop_loss_trigger = stop_loss_price
-        stop_loss_limit = round(stop_loss_price * (1 - buffer_decimal), STOP_LOSS_PRICE_PRECISION)
-    else:  # SHORT: trigger remains; limit is higher.
-        stop_loss_trigger = stop_loss_price
-        stop_loss_limit = round(stop_loss_price * (1 + buffer_decimal), STOP_LOSS_PRICE_PRECISION)
+    # Take profit follows the risk reward ratio; the stop loss limit is buffered lower
+    # for LONG and higher for SHORT, and is rounded away from the trigger so snapping
+    # never removes the buffer.
+    take_profit_price, stop_loss_limit = compute_levels(sign, stop_loss_trigger, entry_price, rr_ratio)
+    take_profit_price, take_profit_s = snap_to_increment(take_profit_price, price_grid)
+    stop_loss_limit, stop_limit_s = snap_to_increment(
+        stop_loss_limit, stop_grid, ROUND_FLOOR if sign > 0 else ROUND_CEILING)
     
-    logging.info(f"Using stop loss trigger: {stop_loss_trigger:.{STOP_LOSS_PRICE_PRECISION}f} and limit: {stop_loss_limit:.{STOP_LOSS_PRICE_PRECISION}f} for a {side_input} position.")
+    # The template is rendered eagerly, so skip it when INFO is disabled.
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info(_PLAN_TEMPLATE.format_map({
+            "take_profit": take_profit_s,
+            "entry": _FMT_PRICE(entry_price),
+            "rr_ratio": rr_ratio,
+            "stop_trigger": stop_trigger_s,
+            "stop_limit": stop_limit_s,
+            "side": side,
+        }))
     
-    # === STOP LOSS ORDER ===
-    logging.info("\n===== STOP LOSS ORDER =====")
-    stop_loss_order = place_single_order(
-        client=client,
-        side=exit_side,
-        product=product,
-        size=size,
-        order_type="stop_loss",
-        price=stop_loss_limit,         # Limit price with buffer (3 decimals)
-        stop_price=stop_loss_trigger,    # Trigger price as supplied (3 decimals)
-        stop_direction=stop_direction
+    # === STOP LOSS AND TAKE PROFIT ORDERS ===
+    # Both only depend on the entry fill, so they are sent concurrently. Their local IDs
+    # are reserved here, so an order that raises can still be logged under its ID.
+    stop_loss_local_id, take_profit_local_id = get_next_order_id(), get_next_order_id()
+    stop_loss_order, take_profit_order = await asyncio.gather(
+        loop.run_in_executor(None, partial(
+            place_single_order,
+            client=client,
+            side=exit_side,
+            product=product,
+            size=size,
+            order_type="stop_loss",
+            price=stop_limit_s,         # Limit price with buffer, on the tick
+            stop_price=stop_trigger_s,    # Trigger price snapped to the tick
+            stop_direction=stop_direction,
+            local_id=stop_loss_local_id
+        )),
+        loop.run_in_executor(None, partial(
+            place_single_order,
+            client=client,
+            side=exit_side,
+            product=product,
+            size=size,
+            order_type="take_profit",
+            price=take_profit_s,
+            local_id=take_profit_local_id
+        )),
+        return_exceptions=True,
     )
+    stop_loss_order = order_result_or_failure(
+        stop_loss_order, stop_loss_local_id, "stop_loss", exit_side, product, size)
+    take_profit_order = order_result_or_failure(
+        take_profit_order, take_profit_local_id, "take_profit", exit_side, product, size)
     
-    # === TAKE PROFIT ORDER ===
-    logging.info("\n===== TAKE PROFIT ORDER =====")
-    take_profit_order = place_single_order(
-        client=client,
-        side=exit_side,
-        product=product,
-        size=size,
-        order_type="take_profit",
-        price=take_profit_price
-    )
+    # An open position without a stop loss must not be left behind: cancel the
+    # take profit (if it was placed) and close the position. This also covers a stop
+    # loss that raised an unexpected exception.
+    if stop_loss_order["exit_code"] != 0:
+        take_profit_id = take_profit_order["coinbase_order_id"]
+        placed_order_ids = [take_profit_id] if take_profit_id else []
+        await loop.run_in_executor(None, rollback_trade, client, exit_side, product,
+                                   size, placed_order_ids)
+        return 1
     
     # ----- FINANCIAL SUMMARY -----
     # Compute differences relative to entry price.
-    if entry_side == "BUY":  # LONG position
-        diff_tp = (take_profit_price - entry_price) / entry_price * 100
-        diff_sl = (stop_loss_price - entry_price) / entry_price * 100
-        # For LONG: columns: TP (left), entry (center), SL (right)
-        col1_title, col2_title, col3_title = "Take Profit", "Entry Price", "Stop Loss"
-        # Use the take profit and stop loss trigger for display.
-        price_tp = take_profit_price
-        price_entry = entry_price
-        price_sl = stop_loss_price
-        diff_tp_val = diff_tp
-        diff_sl_val = diff_sl
-    else:  # SHORT position
-        diff_sl = (stop_loss_price - entry_price) / entry_price * 100
-        diff_tp = (take_profit_price - entry_price) / entry_price * 100
-        # For SHORT: columns: SL (left), entry (center), TP (right)
-        col1_title, col2_title, col3_title = "Stop Loss", "Entry Price", "Take Profit"
-        price_sl = stop_loss_price
-        price_entry = entry_price
-        price_tp = take_profit_price
-        diff_sl_val = diff_sl
-        diff_tp_val = diff_tp
+    diff_tp_str = format_percent((take_profit_price - entry_price) / entry_price * 100)
+    diff_sl_str = format_percent((stop_loss_trigger - entry_price) / entry_price * 100)
 
     # Format numbers without trailing zeroes.
     entry_str = format_float(entry_price, PRICE_PRECISION)
-    tp_str = format_float(price_tp, PRICE_PRECISION)
-    sl_str = format_float(price_sl, PRICE_PRECISION)
-    diff_tp_str = format_percent(diff_tp_val)
-    diff_sl_str = format_percent(diff_sl_val)
-    
+    tp_str = format_float(take_profit_price, PRICE_PRECISION)
+    sl_str = format_float(stop_loss_trigger, PRICE_PRECISION)
+
+    # LONG columns: TP (left), entry (center), SL (right); SHORT shows them reversed.
+    # The stop loss trigger that was sent is displayed, not the buffered limit.
+    columns = [
+        ("Take Profit", tp_str, diff_tp_str),
+        ("Entry Price", entry_str, "0%"),
+        ("Stop Loss", sl_str, diff_sl_str),
+    ]
+    if sign < 0:
+        columns.reverse()
+
     col_width = 15
-    header_line = f"{'':10}{col1_title:<{col_width}}{col2_title:<{col_width}}{col3_title:<{col_width}}"
-    price_row = f"{'Price':10}{tp_str if entry_side=='BUY' else sl_str:<{col_width}}{entry_str:<{col_width}}{sl_str if entry_side=='BUY' else tp_str:<{col_width}}"
-    diff_row = f"{'Diff':10}{diff_tp_str if entry_side=='BUY' else diff_sl_str:<{col_width}}{'0%':<{col_width}}{diff_sl_str if entry_side=='BUY' else diff_tp_str:<{col_width}}"
+    header_line = f"{'':10}" + "".join(f"{title:<{col_width}}" for title, _, _ in columns)
+    price_row = f"{'Price':10}" + "".join(f"{price:<{col_width}}" for _, price, _ in columns)
+    diff_row = f"{'Diff':10}" + "".join(f"{diff:<{col_width}}" for _, _, diff in columns)
     
     # Format risk-profit ratio replacing dot with comma.
     rr_str = str(rr_ratio).replace('.', ',')
     
     final_summary = f"""===== FINANCIAL SUMMARY =====
-Product: {product} | Size: {size} | Side: {side_input} | Risk-Profit Ratio: {rr_str}
+Product: {product} | Size: {size} | Side: {side} | Risk-Profit Ratio: {rr_str}
 {header_line}
 {price_row}
 {diff_row}
@@ -482,9 +806,54 @@ Product: {product} | Size: {size} | Side: {side_input} | Risk-Profit Ratio: {rr_
     if (entry_order["exit_code"] != 0 or
         stop_loss_order["exit_code"] != 0 or
         take_profit_order["exit_code"] != 0):
-        sys.exit(1)
-    else:
-        sys.exit(0)
+        return 1
+    return 0
+
+# --------------------------------------------------
+# MAIN FUNCTION
+# --------------------------------------------------
+def run_trade(side: str, product: str, size: str, stop_loss_price: float,
+              rr_ratio: float = 2.0) -> int:
+    """
+    Synchronous entry point for run_trade_async(), callable in-process
+    (no CLI parsing needed). Returns the exit code.
+    """
+    # asyncio is by far the largest import here; loading it only once a trade runs
+    # keeps --help and argument errors fast.
+    import asyncio
+
+    return asyncio.run(run_trade_async(side, product, size, stop_loss_price, rr_ratio))
+
+def pin_to_cpu() -> None:
+    """
+    Pin the process to the core named by TRADE_CPU and switch it to SCHED_FIFO.
+    Does nothing if TRADE_CPU is unset; failures (no CAP_SYS_NICE, non-Linux
+    platform, invalid core) are logged and the trade runs unpinned.
+    """
+    cpu = os.environ.get(TRADE_CPU_ENV)
+    if not cpu:
+        return
+    try:
+        os.sched_setaffinity(0, {int(cpu)})
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(TRADE_RT_PRIORITY))
+    except ValueError:
+        logging.warning("Ignoring %s=%r: not a CPU number.", TRADE_CPU_ENV, cpu)
+    except (PermissionError, AttributeError, OSError) as e:
+        logging.warning("Could not pin to CPU %s with SCHED_FIFO: %s", cpu, e)
+
+def main() -> None:
+    init_logger(ENABLE_LOGGING)
+    args = parse_args()
+    # Pin only once the arguments are valid, right before the orders are placed.
+    pin_to_cpu()
+    exit_code = run_trade(
+        side=args.side,
+        product=args.product,
+        size=args.size,
+        stop_loss_price=args.stop_loss_price,
+        rr_ratio=args.rr_ratio
+    )
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()